@@ -6,9 +6,9 @@ import os
 import streamlit.components.v1 as components
 import shutil
 import datetime
-import pandas as pd
 import json
-import signal
+import re
+import tempfile
 import psutil
 
 # Install streamlit if not already installed
@@ -18,54 +18,550 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "streamlit"])
     import streamlit as st
 
+# Faster JSON encoding when orjson is available, the stdlib json module otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Persistent storage file
 STREAMS_FILE = "streams_data.json"
 ACTIVE_STREAMS_FILE = "active_streams.json"
 
+# Optional cap on encoding streams, each keeps roughly one core busy. Streams beyond
+# the cap are queued ('Antri') until another one stops. Unset or 0 means no limit,
+# streams loop until stopped so a default cap would keep queued ones waiting forever.
+try:
+    MAX_CONCURRENT_STREAMS = max(int(os.environ.get("MAX_CONCURRENT_STREAMS") or 0), 0) or None
+    MAX_CONCURRENT_STREAMS_INVALID = False
+except ValueError:
+    # Ignored with a warning in the sidebar rather than stopping the app
+    MAX_CONCURRENT_STREAMS = None
+    MAX_CONCURRENT_STREAMS_INVALID = True
+
+# Bitrates of encoded streams, also the limit for streams sent without re-encoding
+VIDEO_BITRATE_KBPS = 2500
+AUDIO_BITRATE_KBPS = 128
+
+# Fixed parts of the ffmpeg command, run_ffmpeg only adds the input, encoder and URL
+FFMPEG_INPUT_ARGS = (
+    "-re",                  # Read input at native frame rate
+    "-stream_loop", "-1"    # Loop the video indefinitely
+)
+ENCODE_OUTPUT_ARGS = (
+    "-b:v", f"{VIDEO_BITRATE_KBPS}k",          # Video bitrate
+    "-maxrate", f"{VIDEO_BITRATE_KBPS}k",      # Maximum bitrate
+    "-bufsize", f"{2 * VIDEO_BITRATE_KBPS}k",  # Buffer size
+    "-g", "60",                                # GOP size
+    "-keyint_min", "60",                       # Minimum GOP size
+    "-c:a", "aac",                             # Audio codec
+    "-b:a", f"{AUDIO_BITRATE_KBPS}k",          # Audio bitrate
+    "-f", "flv"                                # Output format
+)
+COPY_OUTPUT_ARGS = ("-c", "copy", "-f", "flv")
+SHORTS_SIZE = (720, 1280)
+SHORTS_SCALE_FILTER = f"scale={SHORTS_SIZE[0]}:{SHORTS_SIZE[1]}"
+
+# Hardware H.264 encoders tried in order, see detect_video_encoder
+HW_VIDEO_ENCODERS = {
+    'h264_nvenc': ("-c:v", "h264_nvenc", "-preset", "p4", "-tune", "ll", "-rc", "cbr"),
+    'h264_qsv': ("-c:v", "h264_qsv", "-preset", "veryfast"),
+    'h264_vaapi': ("-c:v", "h264_vaapi"),
+    'h264_videotoolbox': ("-c:v", "h264_videotoolbox", "-realtime", "1")
+}
+SOFTWARE_VIDEO_ENCODER = ("-c:v", "libx264", "-preset", "veryfast")
+
+# VAAPI encodes frames that are already on the GPU, ffmpeg opens the render device
+# before the input and uploads the decoded frames at the end of the filter chain
+VAAPI_DEVICE = os.environ.get("VAAPI_DEVICE", "/dev/dri/renderD128")
+VAAPI_UPLOAD_FILTER = "format=nv12,hwupload"
+
+# Set to an encoder name (e.g. libx264) to skip hardware detection
+VIDEO_ENCODER = os.environ.get("VIDEO_ENCODER")
+
+# ffmpeg messages of an encoder that could not be opened, e.g. when the GPU has no free
+# encoder sessions left. A hardware-encoded stream failing with one is restarted with
+# libx264, other failures such as a rejected stream key are reported as they are.
+ENCODER_FAILURE_PATTERN = re.compile(
+    r"Error while opening encoder|Could not open encoder|Unknown encoder|Encoder not found"
+    r"|No capable devices found|No NVENC capable devices|OpenEncodeSessionEx failed"
+    r"|Cannot load libnvidia-encode|Error creating a MFX session|Error initializing an internal MFX session"
+    r"|cannot create compression session|Failed to initialise VAAPI connection|No VA display found"
+    r"|Device creation failed"
+)
+# How much of the log written by a failed ffmpeg is searched for ENCODER_FAILURE_PATTERN
+ENCODER_FAILURE_SCAN_BYTES = 64 * 1024
+
+# Files that are already H.264/AAC within the encoded stream's bitrate and keyframe
+# spacing are sent without re-encoding. Encoding puts a keyframe every 60 frames,
+# 2 s at 30 fps, which is also what YouTube asks for. The slack covers 29.97 fps.
+COPY_MAX_BITRATE = (VIDEO_BITRATE_KBPS + AUDIO_BITRATE_KBPS) * 1000
+COPY_MAX_KEYFRAME_SECONDS = 2.1
+# How much of the file is scanned for keyframes
+KEYFRAME_PROBE_SECONDS = 30
+# Number of files whose probe results are kept, see get_video_info
+PROBE_CACHE_ENTRIES = 64
+
+# Video files that can be streamed, the uploader takes the same list without dots
+VIDEO_EXTENSIONS = ('.mp4', '.flv', '.avi', '.mov', '.mkv')
+VIDEO_UPLOAD_TYPES = tuple(ext[1:] for ext in VIDEO_EXTENSIONS)
+
+# Per-stream log files, named after the stream's ID and kept apart from the videos
+LOG_DIR = "logs"
+LOG_FILE_PATTERN = re.compile(r'^stream_(\d+)\.log$')
+
+# Per-stream pid/status files, see index_stream_files
+STREAM_FILE_PATTERN = re.compile(r'^stream_(\d+)\.(pid|status)$')
+
+# Longest time a scheduled start is caught up after checks were missed, e.g. while the
+# session's browser was asleep. Older schedules wait for their time the next day.
+SCHEDULE_CATCHUP_MINUTES = 5
+
+# How often the Stream Manager table re-checks stream statuses
+STATUS_REFRESH_SECONDS = 3
+
+# Reruns closer together than this reuse the previous status check
+MIN_STATUS_CHECK_SECONDS = 1.0
+
+# How often the Logs section re-reads the log when auto-refresh is on
+LOG_REFRESH_SECONDS = 3
+
+# Static sidebar content, built once at import instead of inline on every rerun
+SPONSOR_AD_HTML = """
+<div style="background:#f0f2f6;padding:20px;border-radius:10px;text-align:center">
+    <script type='text/javascript' 
+            src='//pl26562103.profitableratecpm.com/28/f9/95/28f9954a1d5bbf4924abe123c76a68d2.js'>
+    </script>
+    <p style="color:#888">Iklan akan muncul di sini</p>
+</div>
+"""
+
+HOW_TO_USE_MD = """
+### Instructions:
+
+1. **Add a Stream**: 
+   - Select or upload a video
+   - Enter your YouTube stream key
+   - Set start time and duration
+   - Check "Mode Shorts" for vertical videos
+
+2. **Manage Streams**:
+   - Start/stop streams manually
+   - Streams will start automatically at scheduled time
+   - View logs to monitor streaming status
+   - **Streams will continue running even if you refresh the page!**
+
+### Requirements:
+
+- FFmpeg must be installed on your system
+- Videos must be in a compatible format (MP4 recommended)
+- Your network must allow outbound RTMP traffic
+
+### Notes:
+
+- For YouTube Shorts, use vertical videos (9:16 aspect ratio)
+- Stream keys are sensitive information - keep them private
+- Multiple streams can run simultaneously, but this requires significant CPU and bandwidth
+- **NEW**: Streams now persist across page refreshes and app restarts!
+"""
+
+# Statuses after which a stream can be removed, besides 'error:...' ones
+TERMINAL_STATES = frozenset({'Selesai', 'Dihentikan', 'Terputus'})
+
+# Statuses of a stream that has an ffmpeg thread, either running or queued for a slot
+ACTIVE_STATES = frozenset({'Sedang Live', 'Antri'})
+
+# Status file contents written while a stream thread owns the row, see claim_stream_row.
+# Anything else ("completed", "error: ...", "stopped") is left over from a finished stream.
+CLAIMED_STATUS_VALUES = frozenset({"starting", "queued", "streaming"})
+
+# Status labels for the stream table, error states are handled separately
+STATUS_LABELS = {
+    'Sedang Live': "🟢 Sedang Live",
+    'Antri': "⏳ Antri",
+    'Menunggu': "🟡 Menunggu",
+    'Selesai': "🔵 Selesai",
+    'Dihentikan': "🟠 Dihentikan",
+    'Terputus': "⚫ Terputus"
+}
+
+# Fields of a stream record that are saved, the others are derived by new_stream_record
+STORED_STREAM_FIELDS = ('ID', 'Video', 'Durasi', 'Jam Mulai', 'Streaming Key', 'Status', 'Is Shorts')
+
+def new_stream_record(stream_id, video, duration, start_time, stream_key, is_shorts=False, status='Menunggu'):
+    """Build a stream record as stored in st.session_state.streams"""
+    return {
+        # Names the stream's pid, status and log files, unlike the row index it never changes
+        'ID': stream_id,
+        'Video': video,
+        'Durasi': duration,
+        'Jam Mulai': start_time,
+        'Streaming Key': stream_key,
+        'Status': status,
+        'Is Shorts': bool(is_shorts),
+        # Display name, derived once here instead of on every render
+        'VideoName': os.path.basename(video),
+        'MaskedKey': mask_stream_key(stream_key),
+        # 'Jam Mulai' as minutes since midnight, for the scheduler
+        'StartMinute': minute_of_day(start_time)
+    }
+
+def next_stream_id(streams):
+    """ID for a stream added to streams"""
+    return max((row['ID'] for row in streams), default=-1) + 1
+
+def find_stream_row(streams, stream_id):
+    """Index of the row with the given stream ID, None when there is none"""
+    return next((idx for idx, row in enumerate(streams) if row['ID'] == stream_id), None)
+
+def minute_of_day(hhmm):
+    """Convert an "HH:MM" time to minutes since midnight"""
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def mask_stream_key(stream_key):
+    """Mask a streaming key for display"""
+    return stream_key[:4] + "****" if len(stream_key) > 4 else "****"
+
+def status_label(status):
+    """Label a stream status with its color coding"""
+    if status.startswith('error:'):
+        return "🔴 Error"
+    return STATUS_LABELS.get(status, status)
+
+def dump_json(obj):
+    """Serialize obj to indented JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode()
+
+def load_json(path):
+    """Read and parse a JSON file"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # Older versions wrote NaN, which only the stdlib parser accepts
+    return json.loads(data)
+
+def bad_streams_path():
+    """New file name for stream data that could not be loaded"""
+    return f"{STREAMS_FILE}.{datetime.datetime.now():%Y%m%d-%H%M%S}.bad"
+
+def set_aside_streams_file(reason):
+    """Move an unreadable streams file out of the way, so saving can never overwrite it"""
+    bad_file = bad_streams_path()
+    try:
+        os.replace(STREAMS_FILE, bad_file)
+    except OSError:
+        # The file stays in place, this session must not save over it
+        st.session_state._streams_save_blocked = True
+        st.error(f"{STREAMS_FILE} {reason}. Changes made in this session will not be saved.")
+    else:
+        st.error(f"{STREAMS_FILE} {reason}. It was moved to {bad_file}, the schedule starts empty.")
+
 def load_persistent_streams():
-    """Load streams from persistent storage"""
-    if os.path.exists(STREAMS_FILE):
+    """Load streams from persistent storage as a list of records"""
+    try:
+        data = load_json(STREAMS_FILE)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        # The JSON decode errors of json and orjson are both ValueErrors
+        set_aside_streams_file(f"could not be read ({e})")
+        return []
+    if not isinstance(data, list):
+        set_aside_streams_file("does not contain a list of streams")
+        return []
+    
+    streams = []
+    bad_records = []
+    used_ids = set()
+    for position, record in enumerate(data):
+        try:
+            # Files of older versions have no IDs, their pid/status/log files are named
+            # after the row's position, which then becomes its ID
+            stream_id = record.get('ID', position)
+            if not isinstance(stream_id, int) or stream_id in used_ids:
+                stream_id = max(used_ids | {len(data) - 1}) + 1
+            # Normalize to the fixed schema, older files may lack 'Is Shorts' and the derived fields
+            streams.append(new_stream_record(
+                stream_id, record['Video'], record['Durasi'], record['Jam Mulai'], record['Streaming Key'],
+                # Rows saved before the column existed have NaN here, which must not count as true
+                is_shorts=record.get('Is Shorts') is True, status=record['Status']
+            ))
+            used_ids.add(stream_id)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            bad_records.append(record)
+    
+    if bad_records:
+        # The next save leaves these out of the streams file, keep a copy
+        bad_file = bad_streams_path()
         try:
-            with open(STREAMS_FILE, "r") as f:
-                data = json.load(f)
-                return pd.DataFrame(data)
-        except:
-            return pd.DataFrame(columns=[
-                'Video', 'Durasi', 'Jam Mulai', 'Streaming Key', 'Status', 'Is Shorts'
-            ])
-    return pd.DataFrame(columns=[
-        'Video', 'Durasi', 'Jam Mulai', 'Streaming Key', 'Status', 'Is Shorts'
-    ])
-
-def save_persistent_streams(streams_df):
-    """Save streams to persistent storage"""
+            with open(bad_file, "wb") as f:
+                f.write(dump_json(bad_records))
+        except (OSError, TypeError):
+            st.session_state._streams_save_blocked = True
+            st.error(f"{len(bad_records)} stream(s) in {STREAMS_FILE} could not be read. "
+                     "Changes made in this session will not be saved.")
+        else:
+            st.warning(f"Skipped {len(bad_records)} stream(s) that could not be read, they were saved to {bad_file}.")
+    return streams
+
+def save_persistent_streams(streams):
+    """Save streams to persistent storage, skipped when the content is what this session last wrote"""
+    if st.session_state.get('_streams_save_blocked'):
+        return  # The file on disk could not be loaded and is kept as it is, see load_persistent_streams
     try:
-        with open(STREAMS_FILE, "w") as f:
-            json.dump(streams_df.to_dict('records'), f, indent=2)
+        # The derived fields are rebuilt by load_persistent_streams, the file keeps the original schema
+        payload = dump_json([{field: row[field] for field in STORED_STREAM_FIELDS} for row in streams])
+        payload_hash = hash(payload)
+        if st.session_state.get('_streams_saved_hash') == payload_hash:
+            return
+        # Write to a temporary file first so a crash never leaves a truncated file, one per
+        # save so sessions saving at the same time never write into each other's file
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(STREAMS_FILE)),
+                                          prefix=STREAMS_FILE + ".", suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                tmp.write(payload)
+            os.replace(tmp.name, STREAMS_FILE)
+        except OSError:
+            # A failing cleanup must not hide why the save failed
+            try:
+                os.remove(tmp.name)
+            except OSError:
+                pass
+            raise
+        st.session_state._streams_saved_hash = payload_hash
     except Exception as e:
         st.error(f"Error saving streams: {e}")
 
+def mark_streams_dirty():
+    """Flag the session's streams for saving, see flush_persistent_streams"""
+    st.session_state._streams_dirty = True
+
+def flush_persistent_streams():
+    """Save the session's streams once if anything changed during this run"""
+    if st.session_state.get('_streams_dirty'):
+        st.session_state._streams_dirty = False
+        save_persistent_streams(st.session_state.streams)
+
 def load_active_streams():
     """Load active streams tracking"""
-    if os.path.exists(ACTIVE_STREAMS_FILE):
-        try:
-            with open(ACTIVE_STREAMS_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+    try:
+        return load_json(ACTIVE_STREAMS_FILE)
+    except:
+        return {}
+
+@st.cache_resource
+def get_active_registry():
+    """Active streams of this server process, shared by all sessions and stream threads"""
+    # Read from disk once, afterwards the file is only written so it survives a restart
+    return {'lock': threading.Lock(), 'streams': load_active_streams()}
+
+def get_active_streams():
+    """Snapshot of the active streams tracking"""
+    registry = get_active_registry()
+    with registry['lock']:
+        return dict(registry['streams'])
+
+def update_active_streams(registry, added=None, removed=()):
+    """Add and remove active stream entries, then save the result once"""
+    with registry['lock']:
+        active_streams = registry['streams']
+        active_streams.update(added or {})
+        for stream_id in removed:
+            active_streams.pop(str(stream_id), None)
+        save_active_streams(active_streams)
 
 def save_active_streams(active_streams):
     """Save active streams tracking"""
     try:
-        with open(ACTIVE_STREAMS_FILE, "w") as f:
-            json.dump(active_streams, f, indent=2)
+        with open(ACTIVE_STREAMS_FILE, "wb") as f:
+            f.write(dump_json(active_streams))
     except Exception as e:
         st.error(f"Error saving active streams: {e}")
 
+@st.cache_resource
+def get_stream_slots():
+    """Semaphore shared by all sessions that bounds the number of running encoders, see MAX_CONCURRENT_STREAMS"""
+    return threading.BoundedSemaphore(MAX_CONCURRENT_STREAMS)
+
+@st.cache_resource
+def locate_executable(name):
+    """Path of an executable on PATH, None when it is not installed"""
+    return shutil.which(name)
+
+def find_executable(name):
+    """Resolve an executable once per server process, a missing one is looked up again on the next call"""
+    path = locate_executable(name)
+    if path is None:
+        # Not kept in the cache, so installing it does not require a server restart
+        locate_executable.clear()
+    return path
+
+def find_ffmpeg():
+    """Resolve the ffmpeg executable"""
+    return find_executable('ffmpeg')
+
+def detect_video_encoder(ffmpeg_bin):
+    """Pick the first hardware H.264 encoder that works on this host, libx264 otherwise"""
+    if VIDEO_ENCODER == SOFTWARE_VIDEO_ENCODER[1]:
+        return SOFTWARE_VIDEO_ENCODER  # Keeps its -preset veryfast, x264's default preset is far slower
+    if VIDEO_ENCODER:
+        return HW_VIDEO_ENCODERS.get(VIDEO_ENCODER, ("-c:v", VIDEO_ENCODER))
+    try:
+        listed = subprocess.run(
+            [ffmpeg_bin, "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return SOFTWARE_VIDEO_ENCODER
+    
+    for name, args in HW_VIDEO_ENCODERS.items():
+        if name not in listed:
+            continue
+        # Being built in does not mean the device exists, encode one test frame
+        try:
+            trial = subprocess.run(
+                [ffmpeg_bin, "-hide_banner", "-loglevel", "error", *encoder_device_args(args),
+                 "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+                 "-frames:v", "1", *encoder_filter_args(args), *args, "-f", "null", "-"],
+                capture_output=True, timeout=15
+            )
+        except (OSError, subprocess.SubprocessError):
+            continue
+        if trial.returncode == 0:
+            return args
+    return SOFTWARE_VIDEO_ENCODER
+
+@st.cache_resource
+def get_encoder_state():
+    """Video encoder picked for this server process, shared by all sessions and stream threads"""
+    return {'lock': threading.Lock(), 'encoder': None}
+
+def resolve_video_encoder(encoder_state, ffmpeg_bin):
+    """Encoder arguments from encoder_state, detected by the first caller while later ones wait"""
+    with encoder_state['lock']:
+        if encoder_state['encoder'] is None:
+            encoder_state['encoder'] = detect_video_encoder(ffmpeg_bin)
+        return encoder_state['encoder']
+
+def disable_video_encoder(encoder_state, video_encoder):
+    """Switch later streams to libx264 after video_encoder failed to open"""
+    with encoder_state['lock']:
+        if encoder_state['encoder'] == video_encoder:
+            encoder_state['encoder'] = SOFTWARE_VIDEO_ENCODER
+
+@st.cache_resource
+def warm_video_encoder(ffmpeg_bin):
+    """Detect the video encoder in the background once per server process"""
+    # Its probes can take many seconds, without this the first stream to encode
+    # would wait for them in its own thread
+    thread = threading.Thread(target=resolve_video_encoder, args=(get_encoder_state(), ffmpeg_bin), daemon=True)
+    thread.start()
+    return thread
+
+def find_ffprobe():
+    """Resolve the ffprobe executable"""
+    return find_executable('ffprobe')
+
+@st.cache_resource
+def get_probe_cache():
+    """Probe results by file path, modification time and size, shared by all sessions and stream threads"""
+    return {'lock': threading.Lock(), 'results': {}}
+
+def probe_video(video_path, ffprobe_bin):
+    """Codecs, size and bitrate of a video file"""
+    result = subprocess.run(
+        [ffprobe_bin, "-v", "error",
+         "-show_entries", "stream=codec_type,codec_name,pix_fmt,width,height:format=bit_rate",
+         "-of", "json", video_path],
+        capture_output=True, timeout=30
+    )
+    info = json.loads(result.stdout or b"{}")
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in info.get('streams', []) if s.get('codec_type') == 'audio'), {})
+    vcodec = video.get('codec_name')
+    return {
+        'vcodec': vcodec,
+        'pix_fmt': video.get('pix_fmt'),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'acodec': audio.get('codec_name'),
+        'bit_rate': int(info.get('format', {}).get('bit_rate') or 0),
+        # Only needed to decide on stream copy, which requires H.264
+        'keyframe_gap': probe_keyframe_gap(video_path, ffprobe_bin) if vcodec == 'h264' else None
+    }
+
+def probe_keyframe_gap(video_path, ffprobe_bin):
+    """Longest time between video keyframes at the start of a file, None when it has fewer than two"""
+    # Packet flags come from the container, nothing has to be decoded
+    result = subprocess.run(
+        [ffprobe_bin, "-v", "error", "-select_streams", "v:0",
+         "-read_intervals", f"%+{KEYFRAME_PROBE_SECONDS}",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+        capture_output=True, text=True, timeout=30
+    )
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if flags.startswith('K') and pts_time != 'N/A':
+            keyframes.append(float(pts_time))
+    keyframes.sort()
+    if len(keyframes) < 2:
+        return None
+    return max(b - a for a, b in zip(keyframes, keyframes[1:]))
+
+def get_video_info(video_path, ffprobe_bin, probe_cache):
+    """Probe results for a video file, cached until the file changes, None when ffprobe is missing or fails"""
+    if not ffprobe_bin:
+        return None
+    try:
+        stat = os.stat(video_path)
+        key = (video_path, stat.st_mtime_ns, stat.st_size)
+        with probe_cache['lock']:
+            info = probe_cache['results'].get(key)
+        if info is None:
+            # Probed outside the lock, other streams do not wait for this file's ffprobe runs
+            info = probe_video(video_path, ffprobe_bin)
+            with probe_cache['lock']:
+                results = probe_cache['results']
+                results[key] = info
+                if len(results) > PROBE_CACHE_ENTRIES:
+                    del results[next(iter(results))]  # Oldest entry first
+        return info
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+def is_shorts_sized(info):
+    """Whether a probed video already has the Shorts frame size"""
+    return info is not None and (info['width'], info['height']) == SHORTS_SIZE
+
+def needs_shorts_scale(info, is_shorts):
+    """Whether an encoded Shorts stream needs the scale filter, sources with the target size skip it"""
+    return is_shorts and not is_shorts_sized(info)
+
+def can_stream_copy(info, is_shorts):
+    """Whether a probed video can be streamed as-is, skipping the decode and encode"""
+    if info is None:
+        return False
+    if is_shorts and not is_shorts_sized(info):
+        return False
+    return (
+        info['vcodec'] == 'h264' and info['pix_fmt'] == 'yuv420p'
+        and info['acodec'] == 'aac'
+        and 0 < info['bit_rate'] <= COPY_MAX_BITRATE
+        # Copying keeps the file's keyframes, encoding would insert them every 2 s
+        and info['keyframe_gap'] is not None and info['keyframe_gap'] <= COPY_MAX_KEYFRAME_SECONDS
+    )
+
 def check_ffmpeg():
     """Check if ffmpeg is installed and available"""
-    ffmpeg_path = shutil.which('ffmpeg')
+    ffmpeg_path = find_ffmpeg()
     if not ffmpeg_path:
         st.error("FFmpeg is not installed or not in PATH. Please install FFmpeg to use this application.")
         st.markdown("""
@@ -80,6 +576,13 @@ def check_ffmpeg():
 
 def is_process_running(pid):
     """Check if a process with given PID is still running"""
+    if sys.platform.startswith('linux'):
+        # A single small read of the process name, no psutil.Process object
+        try:
+            with open(f"/proc/{pid}/comm", "rb") as f:
+                return f.read().startswith(b"ffmpeg")
+        except OSError:
+            return False
     try:
         # Check if PID exists and is running
         if psutil.pid_exists(pid):
@@ -91,34 +594,64 @@ def is_process_running(pid):
         pass
     return False
 
+def running_ffmpeg_pids():
+    """PIDs of all running ffmpeg processes, from a single pass over the process table"""
+    return {
+        proc.info['pid'] for proc in psutil.process_iter(['pid', 'name'])
+        if 'ffmpeg' in (proc.info['name'] or '').lower()
+    }
+
+def process_checker():
+    """Function telling whether a pid is a running ffmpeg, for checking many pids at once"""
+    if sys.platform.startswith('linux'):
+        # Reading /proc/<pid>/comm per pid is cheaper than listing every process
+        return is_process_running
+    return running_ffmpeg_pids().__contains__
+
+def index_stream_files():
+    """Map each stream ID to its existing pid/status files, e.g. {0: {'pid': 'stream_0.pid'}}, in one directory scan"""
+    index = {}
+    with os.scandir('.') as entries:
+        for entry in entries:
+            match = STREAM_FILE_PATTERN.match(entry.name)
+            if match:
+                index.setdefault(int(match.group(1)), {})[match.group(2)] = entry.name
+    return index
+
 def reconnect_to_existing_streams():
     """Reconnect to streams that are still running after page refresh"""
-    active_streams = load_active_streams()
-    
-    # Get all existing PID files
-    pid_files = [f for f in os.listdir('.') if f.startswith('stream_') and f.endswith('.pid')]
+    active_streams = get_active_streams()
+    added = {}
+    removed = []
+    is_running = process_checker()
+    streams = st.session_state.streams
     
-    for pid_file in pid_files:
+    for stream_id, stream_files in index_stream_files().items():
+        pid_file = stream_files.get('pid')
+        if not pid_file:
+            continue
+        
         try:
-            row_id = int(pid_file.split('_')[1].split('.')[0])
-            
             # Check if PID file has valid running process
             with open(pid_file, "r") as f:
                 pid = int(f.read().strip())
             
-            if is_process_running(pid):
+            if is_running(pid):
                 # Process is still running, update status
-                if row_id < len(st.session_state.streams):
-                    st.session_state.streams.loc[row_id, 'Status'] = 'Sedang Live'
-                    active_streams[str(row_id)] = {
-                        'pid': pid,
-                        'started_at': datetime.datetime.now().isoformat()
-                    }
+                idx = find_stream_row(streams, stream_id)
+                if idx is not None:
+                    streams[idx]['Status'] = 'Sedang Live'
+                    # Streams that are already tracked keep their entry and start time
+                    if active_streams.get(str(stream_id), {}).get('pid') != pid:
+                        added[str(stream_id)] = {
+                            'pid': pid,
+                            'started_at': datetime.datetime.now().isoformat()
+                        }
             else:
                 # Process is dead, clean up
-                cleanup_stream_files(row_id)
-                if str(row_id) in active_streams:
-                    del active_streams[str(row_id)]
+                cleanup_stream_files(stream_id)
+                if str(stream_id) in active_streams:
+                    removed.append(stream_id)
                 
         except (ValueError, FileNotFoundError, IOError):
             # Invalid file, remove it
@@ -127,220 +660,353 @@ def reconnect_to_existing_streams():
             except:
                 pass
     
-    save_active_streams(active_streams)
+    # Written once, and only when something changed
+    if added or removed:
+        update_active_streams(get_active_registry(), added, removed)
 
-def cleanup_stream_files(row_id):
+def cleanup_stream_files(stream_id):
     """Clean up all files related to a stream"""
     files_to_remove = [
-        f"stream_{row_id}.pid",
-        f"stream_{row_id}.status"
+        f"stream_{stream_id}.pid",
+        f"stream_{stream_id}.status"
     ]
     
     for file_name in files_to_remove:
         try:
-            if os.path.exists(file_name):
-                os.remove(file_name)
-        except:
+            os.remove(file_name)
+        except OSError:
             pass
 
-def run_ffmpeg(video_path, stream_key, is_shorts, row_id):
-    """Stream a video file to RTMP server using ffmpeg"""
-    output_url = f"rtmp://a.rtmp.youtube.com/live2/{stream_key}"
-    
-    # Create log file
-    log_file = f"stream_{row_id}.log"
-    with open(log_file, "w") as f:
-        f.write(f"Starting stream for {video_path} at {datetime.datetime.now()}\n")
-    
-    # Build command with appropriate settings
-    cmd = [
-        "ffmpeg", 
-        "-re",                  # Read input at native frame rate
-        "-stream_loop", "-1",   # Loop the video indefinitely
-        "-i", video_path,       # Input file
-        "-c:v", "libx264",      # Video codec
-        "-preset", "veryfast",  # Encoding preset
-        "-b:v", "2500k",        # Video bitrate
-        "-maxrate", "2500k",    # Maximum bitrate
-        "-bufsize", "5000k",    # Buffer size
-        "-g", "60",             # GOP size
-        "-keyint_min", "60",    # Minimum GOP size
-        "-c:a", "aac",          # Audio codec
-        "-b:a", "128k",         # Audio bitrate
-        "-f", "flv"             # Output format
-    ]
-    
-    # Add scale filter for shorts if needed
-    if is_shorts:
-        cmd += ["-vf", "scale=720:1280"]
+def stream_log_path(stream_id):
+    """Path of the log file of a stream"""
+    return os.path.join(LOG_DIR, f"stream_{stream_id}.log")
+
+def ensure_log_dir():
+    """Create LOG_DIR, moving in the stream logs that older versions kept in the working directory"""
+    try:
+        os.mkdir(LOG_DIR)
+    except FileExistsError:
+        return
+    # Only runs when the directory is created, so the logs are moved exactly once
+    with os.scandir('.') as entries:
+        for entry in entries:
+            if LOG_FILE_PATTERN.match(entry.name):
+                try:
+                    os.replace(entry.name, os.path.join(LOG_DIR, entry.name))
+                except OSError:
+                    pass
+
+def remove_stream_log(stream_id):
+    """Remove the log file of a stream"""
+    try:
+        os.unlink(stream_log_path(stream_id))
+    except FileNotFoundError:
+        pass
+
+def encoder_device_args(video_encoder):
+    """Arguments that open the device of a video encoder, they go before the input"""
+    if video_encoder[1] == "h264_vaapi":
+        return ("-vaapi_device", VAAPI_DEVICE)
+    return ()
+
+def encoder_filter_args(video_encoder, filters=()):
+    """-vf arguments for the given filters, followed by the upload a video encoder needs"""
+    filters = list(filters)
+    if video_encoder[1] == "h264_vaapi":
+        filters.append(VAAPI_UPLOAD_FILTER)
+    return ("-vf", ",".join(filters)) if filters else ()
+
+def build_ffmpeg_command(ffmpeg_bin, video_path, output_url, video_encoder, scale_shorts, stream_copy):
+    """ffmpeg command line that streams a video file to output_url"""
+    cmd = [ffmpeg_bin, *FFMPEG_INPUT_ARGS]
+    if not stream_copy:
+        cmd += encoder_device_args(video_encoder)
+    cmd += ["-i", video_path]
+    if stream_copy:
+        # The file already matches what YouTube expects, send it unchanged
+        cmd += COPY_OUTPUT_ARGS
+    else:
+        cmd += video_encoder
+        cmd += ENCODE_OUTPUT_ARGS
+        # Add scale filter for shorts if needed
+        cmd += encoder_filter_args(video_encoder, [SHORTS_SCALE_FILTER] if scale_shorts else [])
     
     # Add output URL
     cmd.append(output_url)
+    return cmd
+
+def launch_ffmpeg(cmd, log_fp):
+    """Start ffmpeg in its own process group, writing its output straight into the log file"""
+    # Nothing on the Python side has to copy the output line by line
+    log_fp.flush()
+    
+    # Start the process with CREATE_NEW_PROCESS_GROUP on Windows
+    if os.name == 'nt':  # Windows
+        return subprocess.Popen(
+            cmd, 
+            stdout=log_fp, 
+            stderr=subprocess.STDOUT, 
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
+        )
+    else:  # Unix/Linux/Mac
+        return subprocess.Popen(
+            cmd, 
+            stdout=log_fp, 
+            stderr=subprocess.STDOUT, 
+            preexec_fn=os.setsid  # Create new session
+        )
+
+def encoder_failed(log_fp, offset):
+    """Whether the log written by ffmpeg since offset shows an encoder that could not be opened"""
+    log_fp.flush()
+    with open(log_fp.name, "rb") as f:
+        f.seek(offset)
+        data = f.read(ENCODER_FAILURE_SCAN_BYTES)
+    return ENCODER_FAILURE_PATTERN.search(data.decode("utf-8", errors="replace")) is not None
+
+def run_ffmpeg(video_path, stream_key, is_shorts, stream_id, stream_slots, active_registry, encoder_state,
+               probe_cache, ffmpeg_bin="ffmpeg", ffprobe_bin=None):
+    """Stream a video file to RTMP server using ffmpeg"""
+    output_url = f"rtmp://a.rtmp.youtube.com/live2/{stream_key}"
+    status_file = f"stream_{stream_id}.status"
     
-    # Log the command
-    with open(log_file, "a") as f:
-        f.write(f"Running: {' '.join(cmd)}\n")
+    # Keep a single line-buffered handle open for the lifetime of the stream
+    ensure_log_dir()
+    log_fp = open(stream_log_path(stream_id), "w", buffering=1)
+    log_fp.write(f"Starting stream for {video_path} at {datetime.datetime.now()}\n")
     
     try:
-        # Start the process with CREATE_NEW_PROCESS_GROUP on Windows
-        if os.name == 'nt':  # Windows
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.STDOUT, 
-                text=True,
-                bufsize=1,
-                creationflags=subprocess.CREATE_NEW_PROCESS_GROUP
-            )
-        else:  # Unix/Linux/Mac
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.STDOUT, 
-                text=True,
-                bufsize=1,
-                preexec_fn=os.setsid  # Create new session
-            )
+        # The probe runs ffprobe up to twice, here it only holds up this stream
+        info = get_video_info(video_path, ffprobe_bin, probe_cache)
+        stream_copy = can_stream_copy(info, is_shorts)
+        scale_shorts = needs_shorts_scale(info, is_shorts)
+        if stream_copy:
+            log_fp.write("Video already matches the stream settings, sending it without re-encoding.\n")
+        elif is_shorts and not scale_shorts:
+            log_fp.write(f"Video is already {SHORTS_SIZE[0]}x{SHORTS_SIZE[1]}, skipping the scale filter.\n")
+        # Without a cap, and for copied streams that barely use the CPU, nothing waits for a slot
+        if stream_slots is None or stream_copy:
+            stream_slots = threading.BoundedSemaphore(1)
         
-        # Store process ID for later reference
-        with open(f"stream_{row_id}.pid", "w") as f:
-            f.write(str(process.pid))
+        # Copied streams never use an encoder, no need to wait for its detection
+        video_encoder = None if stream_copy else resolve_video_encoder(encoder_state, ffmpeg_bin)
         
-        # Update status
-        with open(f"stream_{row_id}.status", "w") as f:
-            f.write("streaming")
+        # Build command with appropriate settings
+        cmd = build_ffmpeg_command(ffmpeg_bin, video_path, output_url, video_encoder, scale_shorts, stream_copy)
         
-        # Update active streams tracking
-        active_streams = load_active_streams()
-        active_streams[str(row_id)] = {
-            'pid': process.pid,
-            'started_at': datetime.datetime.now().isoformat()
-        }
-        save_active_streams(active_streams)
+        # Log the command
+        log_fp.write(f"Running: {' '.join(cmd)}\n")
         
-        # Read and log output in a separate thread to avoid blocking
-        def log_output():
+        # Wait for a free encoder slot, streams beyond the limit queue up here
+        if not stream_slots.acquire(blocking=False):
+            log_fp.write(f"Waiting for a free slot ({MAX_CONCURRENT_STREAMS} concurrent streams max)...\n")
             try:
-                for line in process.stdout:
-                    with open(log_file, "a") as f:
-                        f.write(line)
-            except:
+                # Shown as 'Antri' rather than live, see check_stream_statuses. Opened
+                # without creating it, a missing file means the stream was already stopped.
+                with open(f"stream_{stream_id}.status", "r+") as f:
+                    f.write("queued")
+                    f.truncate()
+            except FileNotFoundError:
                 pass
-        
-        log_thread = threading.Thread(target=log_output, daemon=True)
-        log_thread.start()
-        
-        # Wait for process to complete
-        process.wait()
-        
-        # Update status when done
-        with open(f"stream_{row_id}.status", "w") as f:
-            f.write("completed")
-        
-        with open(log_file, "a") as f:
-            f.write("Streaming completed.\n")
-        
-        # Remove from active streams
-        active_streams = load_active_streams()
-        if str(row_id) in active_streams:
-            del active_streams[str(row_id)]
-        save_active_streams(active_streams)
+            stream_slots.acquire()
+        try:
+            # The stream may have been stopped while it was queued
+            if not os.path.exists(f"stream_{stream_id}.status"):
+                log_fp.write("Stream was stopped before it started.\n")
+                return
+            
+            while True:
+                # Where this attempt's ffmpeg output starts, see encoder_failed
+                log_fp.flush()
+                log_offset = os.fstat(log_fp.fileno()).st_size
+                process = launch_ffmpeg(cmd, log_fp)
+                
+                # Store process ID for later reference
+                with open(f"stream_{stream_id}.pid", "w") as f:
+                    f.write(str(process.pid))
+                
+                # Update status
+                with open(status_file, "w") as f:
+                    f.write("streaming")
+                
+                # Update active streams tracking
+                update_active_streams(active_registry, added={
+                    str(stream_id): {
+                        'pid': process.pid,
+                        'started_at': datetime.datetime.now().isoformat()
+                    }
+                })
+                
+                # Wait for process to complete
+                returncode = process.wait()
+                
+                # stop_stream marks the status file before terminating ffmpeg
+                stopped = read_status_file(status_file) in (None, "stopped")
+                if (returncode != 0 and not stopped and not stream_copy
+                        and video_encoder[1] != "libx264"
+                        and encoder_failed(log_fp, log_offset)):
+                    # The hardware encoder could not be opened, later streams skip it as well
+                    disable_video_encoder(encoder_state, video_encoder)
+                    log_fp.write(f"Hardware encoder {video_encoder[1]} failed to open (exit {returncode}), "
+                                 "retrying with libx264.\n")
+                    video_encoder = SOFTWARE_VIDEO_ENCODER
+                    cmd = build_ffmpeg_command(ffmpeg_bin, video_path, output_url, video_encoder,
+                                               scale_shorts, stream_copy)
+                    log_fp.write(f"Running: {' '.join(cmd)}\n")
+                    continue
+                break
+            
+            # Update status when done, a stopped stream was already cleaned up by stop_stream
+            if not stopped:
+                with open(status_file, "w") as f:
+                    f.write("completed" if returncode == 0 else f"error: exit {returncode}")
+                
+                log_fp.write("Streaming completed.\n" if returncode == 0 else f"ffmpeg exited with code {returncode}.\n")
+            
+            # Remove from active streams
+            update_active_streams(active_registry, removed=[stream_id])
+            
+        finally:
+            stream_slots.release()
         
     except Exception as e:
         error_msg = f"Error: {str(e)}"
         
         # Write error to log file
-        with open(log_file, "a") as f:
-            f.write(f"{error_msg}\n")
+        log_fp.write(f"{error_msg}\n")
         
         # Write error to status file
-        with open(f"stream_{row_id}.status", "w") as f:
+        with open(status_file, "w") as f:
             f.write(f"error: {str(e)}")
         
         # Remove from active streams
-        active_streams = load_active_streams()
-        if str(row_id) in active_streams:
-            del active_streams[str(row_id)]
-        save_active_streams(active_streams)
+        update_active_streams(active_registry, removed=[stream_id])
     
     finally:
-        with open(log_file, "a") as f:
-            f.write("Streaming finished or stopped.\n")
+        log_fp.write("Streaming finished or stopped.\n")
+        log_fp.close()
         
-        # Clean up PID file
-        cleanup_stream_files(row_id)
+        # Clean up PID file, the status file stays until check_stream_statuses has
+        # picked up the final status
+        try:
+            os.remove(f"stream_{stream_id}.pid")
+        except FileNotFoundError:
+            pass
+
+def claim_stream_row(stream_id):
+    """Mark a row as started by this session, False when a stream thread already owns it"""
+    # Another session may have started this row already, its files and the registry are shared
+    # while each session has its own copy of the streams. Creating the status file exclusively
+    # claims the row, the registry lock keeps two sessions from claiming it at the same time.
+    registry = get_active_registry()
+    status_file = f"stream_{stream_id}.status"
+    with registry['lock']:
+        if str(stream_id) in registry['streams'] or os.path.exists(f"stream_{stream_id}.pid"):
+            return False
+        while True:
+            try:
+                with open(status_file, "x") as f:
+                    f.write("starting")
+                return True
+            except FileExistsError:
+                if read_status_file(status_file) in CLAIMED_STATUS_VALUES:
+                    return False
+            # The final status of an earlier run nobody picked up, e.g. the session that
+            # started it was closed before ffmpeg exited. It does not block a new start.
+            try:
+                os.remove(status_file)
+            except FileNotFoundError:
+                pass
 
 def start_stream(video_path, stream_key, is_shorts, row_id):
     """Start a stream in a separate process (not thread)"""
+    claimed = False
     try:
-        # Update status immediately
-        st.session_state.streams.loc[row_id, 'Status'] = 'Sedang Live'
-        save_persistent_streams(st.session_state.streams)
+        stream_id = st.session_state.streams[row_id]['ID']
+        claimed = claim_stream_row(stream_id)
         
-        # Write initial status file
-        with open(f"stream_{row_id}.status", "w") as f:
-            f.write("starting")
+        # Update status immediately, an already running row only gets this session's copy synced
+        st.session_state.streams[row_id]['Status'] = 'Sedang Live'
+        mark_streams_dirty()
+        if not claimed:
+            st.toast(f"{st.session_state.streams[row_id]['VideoName']} is already running", icon="ℹ️")
+            return False
         
-        # Start streaming in a separate thread (but make it non-daemon)
+        # Start streaming in a separate thread (but make it non-daemon). The video is probed
+        # there, the shared resources are looked up here where Streamlit's caches are available.
+        stream_slots = get_stream_slots() if MAX_CONCURRENT_STREAMS else None
         thread = threading.Thread(
             target=run_ffmpeg,
-            args=(video_path, stream_key, is_shorts, row_id),
+            args=(video_path, stream_key, is_shorts, stream_id, stream_slots, get_active_registry(),
+                  get_encoder_state(), get_probe_cache(), find_ffmpeg() or "ffmpeg", find_ffprobe()),
             daemon=False  # Changed to False so it survives page refresh
         )
         thread.start()
         
         return True
     except Exception as e:
+        if claimed:
+            # No stream thread owns the row, release it so it can be started again
+            cleanup_stream_files(stream_id)
+            st.session_state.streams[row_id]['Status'] = f"error: {e}"
         st.error(f"Error starting stream: {e}")
         return False
 
 def stop_stream(row_id):
     """Stop a running stream"""
     try:
-        active_streams = load_active_streams()
+        stream_id = st.session_state.streams[row_id]['ID']
+        active_streams = get_active_streams()
         
         # First try to get PID from tracking
         pid = None
-        if str(row_id) in active_streams:
-            pid = active_streams[str(row_id)]['pid']
+        if str(stream_id) in active_streams:
+            pid = active_streams[str(stream_id)]['pid']
         
         # If not in tracking, try PID file
-        if not pid and os.path.exists(f"stream_{row_id}.pid"):
-            with open(f"stream_{row_id}.pid", "r") as f:
-                pid = int(f.read().strip())
+        if not pid:
+            try:
+                with open(f"stream_{stream_id}.pid", "r") as f:
+                    pid = int(f.read().strip())
+            except FileNotFoundError:
+                pass
         
         if pid and is_process_running(pid):
             # Try to terminate the process gracefully
             try:
-                if os.name == 'nt':  # Windows
-                    # Use taskkill for Windows
-                    subprocess.run(['taskkill', '/F', '/PID', str(pid)], 
-                                 capture_output=True, check=False)
-                else:  # Unix/Linux/Mac
-                    # Send SIGTERM first, then SIGKILL if needed
+                # Mark the stop first, so run_ffmpeg does not take the exit for a failure
+                with open(f"stream_{stream_id}.status", "w") as f:
+                    f.write("stopped")
+                
+                try:
+                    process = psutil.Process(pid)
+                    procs = [process] + process.children(recursive=True)
+                except psutil.NoSuchProcess:
+                    procs = []  # Process already terminated
+                
+                # Terminate ffmpeg and anything it spawned, then kill whatever
+                # is still alive after the grace period
+                for proc in procs:
+                    try:
+                        proc.terminate()
+                    except psutil.NoSuchProcess:
+                        pass
+                _, alive = psutil.wait_procs(procs, timeout=2)
+                for proc in alive:
                     try:
-                        os.killpg(os.getpgid(pid), signal.SIGTERM)
-                        time.sleep(2)  # Give it time to shut down gracefully
-                        if is_process_running(pid):
-                            os.killpg(os.getpgid(pid), signal.SIGKILL)
-                    except ProcessLookupError:
-                        pass  # Process already terminated
+                        proc.kill()
+                    except psutil.NoSuchProcess:
+                        pass
                 
                 # Update status
-                st.session_state.streams.loc[row_id, 'Status'] = 'Dihentikan'
-                save_persistent_streams(st.session_state.streams)
-                
-                # Update status file
-                with open(f"stream_{row_id}.status", "w") as f:
-                    f.write("stopped")
+                st.session_state.streams[row_id]['Status'] = 'Dihentikan'
+                mark_streams_dirty()
                 
                 # Remove from active streams
-                if str(row_id) in active_streams:
-                    del active_streams[str(row_id)]
-                save_active_streams(active_streams)
+                update_active_streams(get_active_registry(), removed=[stream_id])
                 
                 # Clean up files
-                cleanup_stream_files(row_id)
+                cleanup_stream_files(stream_id)
                 
                 return True
                 
@@ -349,14 +1015,12 @@ def stop_stream(row_id):
                 return False
         else:
             # Process not found, just update status
-            st.session_state.streams.loc[row_id, 'Status'] = 'Dihentikan'
-            save_persistent_streams(st.session_state.streams)
-            cleanup_stream_files(row_id)
+            st.session_state.streams[row_id]['Status'] = 'Dihentikan'
+            mark_streams_dirty()
+            cleanup_stream_files(stream_id)
             
             # Remove from active streams
-            if str(row_id) in active_streams:
-                del active_streams[str(row_id)]
-            save_active_streams(active_streams)
+            update_active_streams(get_active_registry(), removed=[stream_id])
             
             return True
             
@@ -364,73 +1028,294 @@ def stop_stream(row_id):
         st.error(f"Error stopping stream: {str(e)}")
         return False
 
+def read_status_file(status_file):
+    """Contents of a stream's status file, None when there is none"""
+    # stop_stream or another session's status check can remove the file
+    # between the directory scan that found it and this read
+    if not status_file:
+        return None
+    try:
+        with open(status_file, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
 def check_stream_statuses():
     """Check status files for all streams and update accordingly"""
-    active_streams = load_active_streams()
+    active_streams = get_active_streams()
+    removed = []
     
-    for idx, row in st.session_state.streams.iterrows():
-        status_file = f"stream_{idx}.status"
+    # Collect the changes first, they are applied and saved a single time at the end
+    streams = st.session_state.streams
+    updates = {}
+    stream_files = index_stream_files()
+    
+    # Only rows that are tracked as active or have a status file can change
+    candidates = {int(stream_id) for stream_id in active_streams}
+    candidates.update(stream_id for stream_id, files in stream_files.items() if 'status' in files)
+    is_running = process_checker()
+    row_of = {row['ID']: idx for idx, row in enumerate(streams)}
+    
+    for stream_id in sorted(candidates):
+        idx = row_of.get(stream_id)
+        if idx is None:
+            continue
+        current_status = streams[idx]['Status']
+        status_file = stream_files.get(stream_id, {}).get('status')
         
         # Check if stream is supposed to be active
-        if str(idx) in active_streams:
-            pid = active_streams[str(idx)]['pid']
+        if str(stream_id) in active_streams:
+            pid = active_streams[str(stream_id)]['pid']
             
             # Check if process is still running
-            if not is_process_running(pid):
+            if not is_running(pid):
                 # Process died, update status
-                if row['Status'] == 'Sedang Live':
+                if current_status in ACTIVE_STATES:
                     # Check for completion status
-                    if os.path.exists(status_file):
-                        with open(status_file, "r") as f:
-                            status = f.read().strip()
-                        
+                    status = read_status_file(status_file)
+                    if status is not None:
                         if status == "completed":
-                            st.session_state.streams.loc[idx, 'Status'] = 'Selesai'
+                            updates[idx] = 'Selesai'
                         elif status.startswith("error:"):
-                            st.session_state.streams.loc[idx, 'Status'] = status
+                            updates[idx] = status
                         else:
-                            st.session_state.streams.loc[idx, 'Status'] = 'Terputus'
-                        
-                        save_persistent_streams(st.session_state.streams)
-                        os.remove(status_file)
+                            updates[idx] = 'Terputus'
                     
-                    # Remove from active streams
-                    del active_streams[str(idx)]
-                    save_active_streams(active_streams)
-                    cleanup_stream_files(idx)
-        
-        # Regular status file checking
-        elif os.path.exists(status_file):
-            with open(status_file, "r") as f:
-                status = f.read().strip()
+                    # Remove from active streams, cleanup_stream_files also removes the status file
+                    removed.append(stream_id)
+                    cleanup_stream_files(stream_id)
             
-            if status == "completed" and row['Status'] == 'Sedang Live':
-                st.session_state.streams.loc[idx, 'Status'] = 'Selesai'
-                save_persistent_streams(st.session_state.streams)
-                os.remove(status_file)
+            elif current_status == 'Antri':
+                # A queued stream got its slot
+                updates[idx] = 'Sedang Live'
+        
+        # Regular status file checking, a missing file leaves the row as it is
+        else:
+            status = read_status_file(status_file) or ""
             
-            elif status.startswith("error:") and row['Status'] == 'Sedang Live':
-                st.session_state.streams.loc[idx, 'Status'] = status
-                save_persistent_streams(st.session_state.streams)
-                os.remove(status_file)
+            if status == "completed" and current_status in ACTIVE_STATES:
+                updates[idx] = 'Selesai'
+                cleanup_stream_files(stream_id)
+            
+            elif status.startswith("error:") and current_status in ACTIVE_STATES:
+                updates[idx] = status
+                cleanup_stream_files(stream_id)
+            
+            elif status == "queued" and current_status == 'Sedang Live':
+                updates[idx] = 'Antri'
+    
+    if removed:
+        update_active_streams(get_active_registry(), removed=removed)
+    
+    if updates:
+        for idx, status in updates.items():
+            streams[idx]['Status'] = status
+        mark_streams_dirty()
 
 def check_scheduled_streams():
     """Check for streams that need to be started based on schedule"""
-    current_time = datetime.datetime.now().strftime("%H:%M")
+    now = datetime.datetime.now()
+    now_minute = now.hour * 60 + now.minute
     
-    for idx, row in st.session_state.streams.iterrows():
-        if row['Status'] == 'Menunggu' and row['Jam Mulai'] == current_time:
+    # Start everything due since the minute of the previous check, so a run that
+    # skips over a minute boundary does not miss a schedule, but never more than
+    # SCHEDULE_CATCHUP_MINUTES back. Counted in absolute minutes, a gap of a day
+    # or more must not make every schedule due.
+    check_minute = int(now.timestamp() // 60)
+    window = check_minute - st.session_state.get('_schedule_checked_minute', check_minute)
+    window = min(max(window, 1), SCHEDULE_CATCHUP_MINUTES)
+    st.session_state._schedule_checked_minute = check_minute
+    
+    for idx, row in enumerate(st.session_state.streams):
+        # Minutes since the start time, the modulo handles windows that wrap around midnight
+        due = (now_minute - row['StartMinute']) % (24 * 60) < window
+        
+        if due and row['Status'] == 'Menunggu':
             # Start the stream
-            start_stream(row['Video'], row['Streaming Key'], row.get('Is Shorts', False), idx)
+            start_stream(row['Video'], row['Streaming Key'], row['Is Shorts'], idx)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def read_log_tail(log_file, mtime_ns, size, max_lines, tail_bytes):
+    """Read the last lines of a log file as one string, cached on its modification time and size"""
+    # Only read the end of the file, logs of long streams grow without bound
+    with open(log_file, "rb") as f:
+        f.seek(max(0, size - tail_bytes))
+        data = f.read(tail_bytes)
+    # ffmpeg ends its progress lines with a bare carriage return, show each on its own line
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if size > tail_bytes and lines:
+        lines = lines[1:]  # First line is most likely cut in half
+    # Joined once here, a cache hit then copies a single string rather than a list of lines
+    return "".join(line + "\n" for line in lines[-max_lines:])
+
+def get_stream_log_tail(stream_id, max_lines=100, tail_bytes=64 * 1024):
+    """Get the last lines of the log for a specific stream"""
+    log_file = stream_log_path(stream_id)
+    try:
+        stat = os.stat(log_file)
+    except FileNotFoundError:
+        return ""
+    # A log that has not changed since the last rerun is served from the cache
+    return read_log_tail(log_file, stat.st_mtime_ns, stat.st_size, max_lines, tail_bytes)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def scan_video_files(dir_mtime_ns):
+    """List video files in the working directory, cached until the directory changes"""
+    with os.scandir('.') as entries:
+        return [
+            entry.name for entry in entries
+            if entry.is_file() and entry.name.lower().endswith(VIDEO_EXTENSIONS)
+        ]
 
-def get_stream_logs(row_id, max_lines=100):
-    """Get logs for a specific stream"""
-    log_file = f"stream_{row_id}.log"
-    if os.path.exists(log_file):
-        with open(log_file, "r") as f:
-            lines = f.readlines()
-        return lines[-max_lines:] if len(lines) > max_lines else lines
-    return []
+def list_video_files():
+    """Video files in the working directory, only rescanned after files were added or removed"""
+    return scan_video_files(os.stat('.').st_mtime_ns)
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def scan_log_stream_ids(dir_mtime_ns):
+    """List the stream IDs that have a log file, cached until the log directory changes"""
+    with os.scandir(LOG_DIR) as entries:
+        matches = map(LOG_FILE_PATTERN.match, (entry.name for entry in entries))
+        return [int(match.group(1)) for match in matches if match]
+
+def list_log_stream_ids():
+    """Stream IDs with a log file, only rescanned after logs were added or removed"""
+    try:
+        dir_mtime_ns = os.stat(LOG_DIR).st_mtime_ns
+    except FileNotFoundError:
+        # First run of this version, pick up the logs of earlier ones
+        ensure_log_dir()
+        dir_mtime_ns = os.stat(LOG_DIR).st_mtime_ns
+    return scan_log_stream_ids(dir_mtime_ns)
+
+def show_stream_logs(stream_id):
+    """Display the log tail of a stream"""
+    st.code(get_stream_log_tail(stream_id))
+
+@st.fragment(run_every=STATUS_REFRESH_SECONDS)
+def stream_monitor():
+    """Sidebar stream summary, re-run on its own timer to check statuses and schedules"""
+    # Start due streams and pick up finished ones, the whole app only needs
+    # to rerun when a status changed. Bursts of reruns check only once.
+    now = time.monotonic()
+    if now - st.session_state.get('_last_status_check', 0.0) >= MIN_STATUS_CHECK_SECONDS:
+        st.session_state._last_status_check = now
+        statuses = [row['Status'] for row in st.session_state.streams]
+        check_scheduled_streams()
+        check_stream_statuses()
+        if [row['Status'] for row in st.session_state.streams] != statuses:
+            st.rerun()
+    
+    # Show persistent stream info
+    active_streams = get_active_streams()
+    if active_streams:
+        st.success(f"🟢 {len(active_streams)} stream(s) berjalan")
+    else:
+        st.info("⚫ Tidak ada stream aktif")
+    if MAX_CONCURRENT_STREAMS:
+        st.caption(f"Maksimal {MAX_CONCURRENT_STREAMS} stream bersamaan, sisanya antri.")
+    elif MAX_CONCURRENT_STREAMS_INVALID:
+        st.warning(f"MAX_CONCURRENT_STREAMS={os.environ.get('MAX_CONCURRENT_STREAMS')!r} is not a number "
+                   "of streams and was ignored, streams are not limited.")
+
+def rerun_stream_manager():
+    """Rerun only the streams table, saving first since fragment runs skip the save at the end of the script"""
+    flush_persistent_streams()
+    try:
+        st.rerun(scope="fragment")
+    except st.errors.StreamlitAPIException:
+        # The click arrived with a full run rather than a fragment run
+        st.rerun()
+
+@st.fragment
+def stream_manager():
+    """Streams table, picking a stream only reruns this part of the page"""
+    # Display the streams table with action buttons
+    if st.session_state.streams:
+        streams = st.session_state.streams
+        # A single table widget instead of a row of columns per stream
+        st.dataframe(
+            [
+                {
+                    'ID': row['ID'],
+                    'Video': row['VideoName'],
+                    'Duration': row['Durasi'],
+                    'Start Time': row['Jam Mulai'],
+                    'Streaming Key': row['MaskedKey'],
+                    'Status': status_label(row['Status'])
+                }
+                for i, row in enumerate(streams)
+            ],
+            column_config={
+                'ID': st.column_config.NumberColumn(width="small"),
+                'Video': st.column_config.TextColumn(width="large")
+            },
+            hide_index=True
+        )
+        
+        # Action bar for the selected stream
+        action_cols = st.columns([4, 2])
+        i = action_cols[0].selectbox(
+            "Stream",
+            range(len(streams)),
+            format_func=lambda idx: f"{streams[idx]['ID']}: {streams[idx]['VideoName']} ({streams[idx]['Jam Mulai']})",
+            key="selected_stream"
+        )
+        row = streams[i]
+        status = row['Status']
+        
+        if status == 'Menunggu':
+            if action_cols[1].button("▶️ Start", key="start_stream"):
+                if start_stream(row['Video'], row['Streaming Key'], row['Is Shorts'], i):
+                    st.toast(f"Started {row['VideoName']}", icon="▶️")
+                    rerun_stream_manager()
+                elif row['Status'] != 'Menunggu':
+                    # Started by another session, show the synced status
+                    rerun_stream_manager()
+        
+        elif status in ACTIVE_STATES:
+            if action_cols[1].button("⏹️ Stop", key="stop_stream"):
+                if stop_stream(i):
+                    st.toast(f"Stopped {row['VideoName']}", icon="⏹️")
+                    rerun_stream_manager()
+        
+        elif status in TERMINAL_STATES or status.startswith('error:'):
+            if action_cols[1].button("🗑️ Remove", key="remove_stream"):
+                streams.pop(i)
+                mark_streams_dirty()
+                # Also remove its log
+                remove_stream_log(row['ID'])
+                st.toast(f"Removed {row['VideoName']}", icon="🗑️")
+                rerun_stream_manager()
+    else:
+        st.info("No streams added yet. Use the 'Add New Stream' tab to add a stream.")
+
+@st.fragment
+def stream_log_viewer():
+    """Log viewer, switching streams or toggling auto-refresh only reruns this part of the page"""
+    # Get all stream IDs that have log files
+    stream_ids = list_log_stream_ids()
+    
+    if stream_ids:
+        # The selectbox returns the stream ID itself, the label is only for display
+        streams = st.session_state.streams
+        names = {row['ID']: row['VideoName'] for row in streams}
+        stream_options = [stream_id for stream_id in stream_ids if stream_id in names]
+        
+        if stream_options:
+            selected_id = st.selectbox(
+                "Select stream to view logs", options=stream_options,
+                format_func=lambda stream_id: f"{names[stream_id]} (ID: {stream_id})"
+            )
+            
+            # Auto-refresh option, only the log view reruns on its timer
+            auto_refresh = st.checkbox("Auto-refresh logs", value=False)
+            log_view = st.fragment(show_stream_logs, run_every=LOG_REFRESH_SECONDS if auto_refresh else None)
+            log_view(selected_id)
+        else:
+            st.info("No logs available. Start a stream to see logs.")
+    else:
+        st.info("No logs available. Start a stream to see logs.")
 
 def main():
     # Page configuration must be the first Streamlit command
@@ -445,6 +1330,7 @@ def main():
     # Check if ffmpeg is installed
     if not check_ffmpeg():
         return
+    warm_video_encoder(find_ffmpeg())
     
     # Initialize session state with persistent data
     if 'streams' not in st.session_state:
@@ -457,157 +1343,91 @@ def main():
     show_ads = st.sidebar.checkbox("Tampilkan Iklan", value=False)
     if show_ads:
         st.sidebar.subheader("Iklan Sponsor")
-        components.html(
-            """
-            <div style="background:#f0f2f6;padding:20px;border-radius:10px;text-align:center">
-                <script type='text/javascript' 
-                        src='//pl26562103.profitableratecpm.com/28/f9/95/28f9954a1d5bbf4924abe123c76a68d2.js'>
-                </script>
-                <p style="color:#888">Iklan akan muncul di sini</p>
-            </div>
-            """,
-            height=300
-        )
-    
-    # Check status of running streams
-    check_stream_statuses()
+        components.html(SPONSOR_AD_HTML, height=300)
     
-    # Check for scheduled streams
-    check_scheduled_streams()
-    
-    # Auto-refresh every 10 seconds to check stream status
     if st.sidebar.button("🔄 Refresh Status"):
         st.rerun()
     
-    # Show persistent stream info
-    active_streams = load_active_streams()
-    if active_streams:
-        st.sidebar.success(f"🟢 {len(active_streams)} stream(s) berjalan")
-    else:
-        st.sidebar.info("⚫ Tidak ada stream aktif")
+    # Scheduled starts and status checks run on the monitor's own timer
+    with st.sidebar:
+        stream_monitor()
     
-    # Create tabs for different sections
-    tab1, tab2, tab3 = st.tabs(["Stream Manager", "Add New Stream", "Logs"])
+    # Navigation between sections, unlike st.tabs only the selected one is built
+    active_tab = st.radio(
+        "Section", ["Stream Manager", "Add New Stream", "Logs"],
+        key="active_tab", horizontal=True, label_visibility="collapsed"
+    )
     
-    with tab1:
+    if active_tab == "Stream Manager":
         st.subheader("Manage Streams")
         
         # Auto refresh indicator
         st.caption("Status akan diperbarui otomatis. Streaming akan tetap berjalan meski halaman di-refresh.")
         
-        # Display the streams table with action buttons
-        if not st.session_state.streams.empty:
-            # Create a header row
-            header_cols = st.columns([2, 1, 1, 2, 2, 2])
-            header_cols[0].write("**Video**")
-            header_cols[1].write("**Duration**")
-            header_cols[2].write("**Start Time**")
-            header_cols[3].write("**Streaming Key**")
-            header_cols[4].write("**Status**")
-            header_cols[5].write("**Action**")
-            
-            # Display each stream
-            for i, row in st.session_state.streams.iterrows():
-                cols = st.columns([2, 1, 1, 2, 2, 2])
-                cols[0].write(os.path.basename(row['Video']))  # Just show filename
-                cols[1].write(row['Durasi'])
-                cols[2].write(row['Jam Mulai'])
-                # Mask streaming key for security
-                masked_key = row['Streaming Key'][:4] + "****" if len(row['Streaming Key']) > 4 else "****"
-                cols[3].write(masked_key)
-                
-                # Status with color coding
-                status = row['Status']
-                if status == 'Sedang Live':
-                    cols[4].markdown(f"🟢 **{status}**")
-                elif status == 'Menunggu':
-                    cols[4].markdown(f"🟡 **{status}**")
-                elif status == 'Selesai':
-                    cols[4].markdown(f"🔵 **{status}**")
-                elif status == 'Dihentikan':
-                    cols[4].markdown(f"🟠 **{status}**")
-                elif status.startswith('error:'):
-                    cols[4].markdown(f"🔴 **Error**")
-                else:
-                    cols[4].write(status)
-                
-                # Action buttons
-                if row['Status'] == 'Menunggu':
-                    if cols[5].button("▶️ Start", key=f"start_{i}"):
-                        if start_stream(row['Video'], row['Streaming Key'], row.get('Is Shorts', False), i):
-                            st.rerun()
-                
-                elif row['Status'] == 'Sedang Live':
-                    if cols[5].button("⏹️ Stop", key=f"stop_{i}"):
-                        if stop_stream(i):
-                            st.rerun()
-                
-                elif row['Status'] in ['Selesai', 'Dihentikan', 'Terputus'] or row['Status'].startswith('error:'):
-                    if cols[5].button("🗑️ Remove", key=f"remove_{i}"):
-                        st.session_state.streams = st.session_state.streams.drop(i).reset_index(drop=True)
-                        save_persistent_streams(st.session_state.streams)
-                        # Also remove log file if it exists
-                        log_file = f"stream_{i}.log"
-                        if os.path.exists(log_file):
-                            os.remove(log_file)
-                        st.rerun()
-        else:
-            st.info("No streams added yet. Use the 'Add New Stream' tab to add a stream.")
+        stream_manager()
     
-    with tab2:
+    elif active_tab == "Add New Stream":
         st.subheader("Add New Stream")
         
         # List available video files
-        video_files = [f for f in os.listdir('.') if f.endswith(('.mp4', '.flv', '.avi', '.mov', '.mkv'))]
+        video_files = list_video_files()
+        
+        # Uploads are saved right away, so the uploader stays outside the form
+        uploaded_file = st.file_uploader("Upload video baru", type=VIDEO_UPLOAD_TYPES)
         
-        col1, col2 = st.columns(2)
+        # Only the file name is used, a client supplied path never leaves the working directory
+        upload_path = os.path.basename(uploaded_file.name) if uploaded_file else None
         
-        with col1:
-            st.write("Video yang tersedia:")
-            selected_video = st.selectbox("Pilih video", [""] + video_files) if video_files else None
+        if uploaded_file:
+            # The upload stays in the widget across reruns, write it to disk only once
+            if st.session_state.get('_saved_upload_id') != uploaded_file.file_id:
+                # Save the uploaded file in 1 MiB chunks rather than one copy of the whole video
+                uploaded_file.seek(0)
+                with open(upload_path, "wb") as f:
+                    shutil.copyfileobj(uploaded_file, f, 1 << 20)
+                st.session_state._saved_upload_id = uploaded_file.file_id
+            st.success(f"Video berhasil diupload! ({uploaded_file.size / (1024 * 1024):.1f} MB)")
+        
+        # The inputs only take effect on submit, typing does not rerun the app
+        with st.form("add_stream_form"):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.write("Video yang tersedia:")
+                selected_video = st.selectbox("Pilih video", [""] + video_files) if video_files else None
             
-            uploaded_file = st.file_uploader("Atau upload video baru", type=['mp4', 'flv', 'avi', 'mov', 'mkv'])
+            with col2:
+                stream_key = st.text_input("Stream Key", type="password")
+                
+                # Time picker for start time, the default is taken once per session
+                default_time = st.session_state.setdefault('add_default_time', datetime.datetime.now().time())
+                start_time = st.time_input("Start Time", value=default_time)
+                
+                duration = st.text_input("Duration (HH:MM:SS)", value="01:00:00")
+                
+                is_shorts = st.checkbox("Mode Shorts (720x1280)")
             
+            submitted = st.form_submit_button("➕ Add Stream")
+        
+        if submitted:
+            # A freshly uploaded video takes precedence over the selection
             if uploaded_file:
-                # Save the uploaded file
-                with open(uploaded_file.name, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                st.success("Video berhasil diupload!")
-                video_path = uploaded_file.name
+                video_path = upload_path
             elif selected_video:
                 video_path = selected_video
             else:
                 video_path = None
-        
-        with col2:
-            stream_key = st.text_input("Stream Key", type="password")
-            
-            # Time picker for start time
-            now = datetime.datetime.now()
-            start_time = st.time_input("Start Time", value=now)
-            start_time_str = start_time.strftime("%H:%M")
             
-            duration = st.text_input("Duration (HH:MM:SS)", value="01:00:00")
-            
-            is_shorts = st.checkbox("Mode Shorts (720x1280)")
-        
-        if st.button("➕ Add Stream"):
             if video_path and stream_key:
-                # Get just the filename from the path
-                video_filename = os.path.basename(video_path)
-                
-                new_stream = pd.DataFrame({
-                    'Video': [video_path],
-                    'Durasi': [duration],
-                    'Jam Mulai': [start_time_str],
-                    'Streaming Key': [stream_key],
-                    'Status': ['Menunggu'],
-                    'Is Shorts': [is_shorts]
-                })
-                
-                st.session_state.streams = pd.concat([st.session_state.streams, new_stream], ignore_index=True)
-                save_persistent_streams(st.session_state.streams)
-                st.success(f"Added stream for {video_filename}")
+                start_time_str = start_time.strftime("%H:%M")
+                new_stream = new_stream_record(next_stream_id(st.session_state.streams), video_path, duration,
+                                               start_time_str, stream_key, is_shorts)
+                st.session_state.streams.append(new_stream)
+                mark_streams_dirty()
+                # Next stream defaults to the time it is added at
+                st.session_state.pop('add_default_time', None)
+                # A toast survives the rerun, a success message would be gone before it is seen
+                st.toast(f"Added stream for {new_stream['VideoName']}", icon="✅")
                 st.rerun()
             else:
                 if not video_path:
@@ -615,74 +1435,18 @@ def main():
                 if not stream_key:
                     st.error("Please provide a streaming key")
     
-    with tab3:
+    elif active_tab == "Logs":
         st.subheader("Stream Logs")
         
-        # Get all stream IDs that have log files
-        log_files = [f for f in os.listdir('.') if f.startswith('stream_') and f.endswith('.log')]
-        stream_ids = [int(f.split('_')[1].split('.')[0]) for f in log_files]
-        
-        if stream_ids:
-            # Create options for selectbox
-            stream_options = {}
-            for idx in stream_ids:
-                if idx in st.session_state.streams.index:
-                    video_name = os.path.basename(st.session_state.streams.loc[idx, 'Video'])
-                    stream_options[f"{video_name} (ID: {idx})"] = idx
-            
-            if stream_options:
-                selected_stream = st.selectbox("Select stream to view logs", options=list(stream_options.keys()))
-                selected_id = stream_options[selected_stream]
-                
-                # Display logs
-                logs = get_stream_logs(selected_id)
-                log_container = st.container()
-                with log_container:
-                    st.code("".join(logs))
-                
-                # Auto-refresh option
-                auto_refresh = st.checkbox("Auto-refresh logs", value=False)
-                if auto_refresh:
-                    time.sleep(3)  # Wait 3 seconds
-                    st.rerun()
-            else:
-                st.info("No logs available. Start a stream to see logs.")
-        else:
-            st.info("No logs available. Start a stream to see logs.")
+        stream_log_viewer()
     
     # Instructions
     with st.sidebar.expander("How to use"):
-        st.markdown("""
-        ### Instructions:
-        
-        1. **Add a Stream**: 
-           - Select or upload a video
-           - Enter your YouTube stream key
-           - Set start time and duration
-           - Check "Mode Shorts" for vertical videos
-        
-        2. **Manage Streams**:
-           - Start/stop streams manually
-           - Streams will start automatically at scheduled time
-           - View logs to monitor streaming status
-           - **Streams will continue running even if you refresh the page!**
-        
-        ### Requirements:
-        
-        - FFmpeg must be installed on your system
-        - Videos must be in a compatible format (MP4 recommended)
-        - Your network must allow outbound RTMP traffic
-        
-        ### Notes:
-        
-        - For YouTube Shorts, use vertical videos (9:16 aspect ratio)
-        - Stream keys are sensitive information - keep them private
-        - Multiple streams can run simultaneously, but this requires significant CPU and bandwidth
-        - **NEW**: Streams now persist across page refreshes and app restarts!
-        """)
-    
-    # Auto refresh every 30 seconds
-    time.sleep(1)  # Small delay to prevent too frequent refreshing
+        st.markdown(HOW_TO_USE_MD)
 
 if __name__ == '__main__':
-    main()
+    try:
+        main()
+    finally:
+        # Also runs when st.rerun() or st.stop() interrupt the script
+        flush_persistent_streams()